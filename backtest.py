@@ -1,90 +1,106 @@
 ﻿# backtest.py
+from __future__ import annotations
 import asyncio
 import argparse
-import yaml
 import os
 from datetime import datetime
-import pandas as pd
-import numpy as np
+from typing import Optional, Tuple, TYPE_CHECKING
+
+# pandas/numpy/ccxt грузятся внутри функций: --help и старт воркеров не платят за них
+if TYPE_CHECKING:
+    import pandas as pd
+    import numpy as np
 
 from exchange import create_exchange, fetch_ohlcv
 from strategy import Strategy
 from db import init_db, create_run, log_trade
-from utils import calculate_drawdown, calculate_sharpe, cagr
+from indicator_cache import series_fingerprint
+from backtest_cache import BacktestCache, BacktestResult
+from profiler import PROFILER, PROFILE_MODES, profiled, stage
 
-async def run_backtest(symbol: str, timeframe: str, candles: int, cfg: dict):
-    exchange = create_exchange(testnet=False, default_type=cfg.get("default_market_type","swap"))
-    df = await fetch_ohlcv(exchange, symbol, timeframe, limit=candles)
-    if df.empty:
-        print("No data for", symbol)
-        return
+COMMISSION = 0.00075
+SLIPPAGE = 0.0005
+INITIAL_BALANCE = 10000.0
 
-    strat = Strategy(cfg.get("strategy", {}), param_getter=lambda k, d=None: cfg.get("risk", {}).get(k.lower(), d))
-    df = strat.compute_indicators(df)
-    # warm up
-    warm = max(strat.map["ema_slow"], strat.map["rsi_len"], strat.map["atr_len"]) + 5
+def warmup_bars(strat: Strategy) -> int:
+    return max(strat.map["ema_slow"], strat.map["rsi_len"], strat.map["atr_len"]) + 5
+
+def bar_ts_ns(df: pd.DataFrame) -> np.ndarray:
+    import numpy as np
+    import pandas as pd
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df.index.values.astype("datetime64[ns]").astype("int64")
+    return np.arange(len(df), dtype="int64")
+
+def simulate(df: pd.DataFrame, strat: Strategy, commission: float = COMMISSION, slippage: float = SLIPPAGE,
+             initial: float = INITIAL_BALANCE, warm: Optional[int] = None) -> BacktestResult:
+    # df уже с индикаторами; сделки собираются в список, в БД пишет вызывающий
+    import numpy as np
+    if warm is None:
+        warm = warmup_bars(strat)
+    bar_ts = bar_ts_ns(df)
 
-    balance = 10000.0
+    balance = initial
     pos = None
     eq_curve = []
-    run_id = create_run(f"backtest {symbol} {timeframe} {datetime.utcnow().isoformat()}")
-    commission = 0.00075
-    slippage = 0.0005
+    trades = []
 
     for i in range(warm, len(df)):
         window = df.iloc[:i+1]
         sig = strat.generate_signal(window, equity_usdt=balance)
         price = float(df.iloc[i]["close"])
-        if pos:
-            # manage pos: trailing stop / partial tp (simplified)
-            atr = float(df.iloc[i]["atr"])
-            # trailing
-            if pos["side"] == "long":
-                trail_stop = max(pos["stop_px"], price - atr*strat.map["atr_mult_trail"])
-                if price <= trail_stop:
-                    # exit
-                    exit_price = price*(1 - slippage)
-                    pnl = (exit_price - pos["entry_px"])*pos["qty"] - exit_price*pos["qty"]*commission
-                    balance += pos["qty"]*exit_price
-                    log_trade(run_id, symbol, pos["side"], "close", pos["qty"], exit_price, pos["qty"]*exit_price, pnl, "bt_exit")
-                    pos = None
-                elif price >= pos["tp_px"]:
-                    # partial tp
-                    close_qty = pos["qty"] * strat.map["partial_tp_ratio"]
-                    exit_price = price*(1 - slippage)
-                    pnl = (exit_price - pos["entry_px"])*close_qty - exit_price*close_qty*commission
-                    balance += close_qty*exit_price
-                    pos["qty"] -= close_qty
-                    log_trade(run_id, symbol, pos["side"], "partial_close", close_qty, exit_price, close_qty*exit_price, pnl, "bt_partial_tp")
-            else:
-                trail_stop = min(pos["stop_px"], price + atr*strat.map["atr_mult_trail"])
-                if price >= trail_stop:
-                    exit_price = price*(1 + slippage)
-                    pnl = (pos["entry_px"] - exit_price)*pos["qty"] - exit_price*pos["qty"]*commission
-                    balance += pos["qty"]* (2*pos["entry_px"] - exit_price)  # approximate for short
-                    log_trade(run_id, symbol, pos["side"], "close", pos["qty"], exit_price, pos["qty"]*exit_price, pnl, "bt_exit")
-                    pos = None
-                elif price <= pos["tp_px"]:
-                    close_qty = pos["qty"] * strat.map["partial_tp_ratio"]
-                    exit_price = price*(1 + slippage)
-                    pnl = (pos["entry_px"] - exit_price)*close_qty - exit_price*close_qty*commission
-                    balance += close_qty * (2*pos["entry_px"] - exit_price)
-                    pos["qty"] -= close_qty
-                    log_trade(run_id, symbol, pos["side"], "partial_close", close_qty, exit_price, close_qty*exit_price, pnl, "bt_partial_tp")
-
-        if not pos and sig.side != "hold":
-            usdt = sig.info["usdt_size"]
-            if usdt > balance:
-                usdt = balance
-            qty = usdt / price
-            entry_price = price*(1 + slippage if sig.side=="long" else 1 - slippage)
-            entry_cost = qty*entry_price*(1 + commission)
-            if entry_cost > balance:
-                qty = balance / (entry_price*(1+commission))
-                entry_cost = balance
-            log_trade(run_id, symbol, sig.side, "open", qty, entry_price, entry_cost, None, "bt_entry")
-            balance -= entry_cost
-            pos = {"side": sig.side, "qty": qty, "entry_px": entry_price, "stop_px": sig.stop_price, "tp_px": sig.tp_price}
+        ts = int(bar_ts[i])
+        with stage("position"):
+            if pos:
+                # manage pos: trailing stop / partial tp (simplified)
+                atr = float(df.iloc[i]["atr"])
+                # trailing
+                if pos["side"] == "long":
+                    trail_stop = max(pos["stop_px"], price - atr*strat.map["atr_mult_trail"])
+                    if price <= trail_stop:
+                        # exit
+                        exit_price = price*(1 - slippage)
+                        pnl = (exit_price - pos["entry_px"])*pos["qty"] - exit_price*pos["qty"]*commission
+                        balance += pos["qty"]*exit_price
+                        trades.append((ts, pos["side"], "close", pos["qty"], exit_price, pos["qty"]*exit_price, pnl, "bt_exit"))
+                        pos = None
+                    elif price >= pos["tp_px"]:
+                        # partial tp
+                        close_qty = pos["qty"] * strat.map["partial_tp_ratio"]
+                        exit_price = price*(1 - slippage)
+                        pnl = (exit_price - pos["entry_px"])*close_qty - exit_price*close_qty*commission
+                        balance += close_qty*exit_price
+                        pos["qty"] -= close_qty
+                        trades.append((ts, pos["side"], "partial_close", close_qty, exit_price, close_qty*exit_price, pnl, "bt_partial_tp"))
+                else:
+                    trail_stop = min(pos["stop_px"], price + atr*strat.map["atr_mult_trail"])
+                    if price >= trail_stop:
+                        exit_price = price*(1 + slippage)
+                        pnl = (pos["entry_px"] - exit_price)*pos["qty"] - exit_price*pos["qty"]*commission
+                        balance += pos["qty"]* (2*pos["entry_px"] - exit_price)  # approximate for short
+                        trades.append((ts, pos["side"], "close", pos["qty"], exit_price, pos["qty"]*exit_price, pnl, "bt_exit"))
+                        pos = None
+                    elif price <= pos["tp_px"]:
+                        close_qty = pos["qty"] * strat.map["partial_tp_ratio"]
+                        exit_price = price*(1 + slippage)
+                        pnl = (pos["entry_px"] - exit_price)*close_qty - exit_price*close_qty*commission
+                        balance += close_qty * (2*pos["entry_px"] - exit_price)
+                        pos["qty"] -= close_qty
+                        trades.append((ts, pos["side"], "partial_close", close_qty, exit_price, close_qty*exit_price, pnl, "bt_partial_tp"))
+
+            if not pos and sig.side != "hold":
+                usdt = sig.info["usdt_size"]
+                if usdt > balance:
+                    usdt = balance
+                qty = usdt / price
+                entry_price = price*(1 + slippage if sig.side=="long" else 1 - slippage)
+                entry_cost = qty*entry_price*(1 + commission)
+                if entry_cost > balance:
+                    qty = balance / (entry_price*(1+commission))
+                    entry_cost = balance
+                trades.append((ts, sig.side, "open", qty, entry_price, entry_cost, None, "bt_entry"))
+                balance -= entry_cost
+                pos = {"side": sig.side, "qty": qty, "entry_px": entry_price, "stop_px": sig.stop_price, "tp_px": sig.tp_price}
 
         # equity
         equity = balance
@@ -106,25 +122,256 @@ async def run_backtest(symbol: str, timeframe: str, candles: int, cfg: dict):
         else:
             pnl = (pos["entry_px"] - exit_price)*pos["qty"] - exit_price*pos["qty"]*commission
             balance += pos["qty"]*(2*pos["entry_px"] - exit_price)
-        log_trade(run_id, symbol, pos["side"], "close", pos["qty"], exit_price, pos["qty"]*exit_price, pnl, "bt_final")
+        trades.append((int(bar_ts[-1]), pos["side"], "close", pos["qty"], exit_price, pos["qty"]*exit_price, pnl, "bt_final"))
+
+    if eq_curve:
+        curve = np.array(eq_curve)
+        curve_ts = np.asarray(bar_ts[warm:warm+len(curve)], dtype="int64")
+    else:
+        curve = np.array([initial, balance])
+        curve_ts = np.asarray(bar_ts[[0, -1]] if len(bar_ts) else [0, 0], dtype="int64")
+    return BacktestResult(curve_ts, curve, trades, curve_metrics(curve, df))
+
+FILL_MODELS = ("close", "intrabar")
+# порядок внутри бара, если и стоп, и тейк попали в high/low: stop — худший случай
+INTRABAR_PRIORITIES = ("stop", "tp")
+SCAN_CHUNK = 32
+
+@profiled("position")
+def _scan_exit(side: int, j: int, stop0: float, tp: float, trail_base, high, low):
+    # первый бар после j, где high/low задевают тейк и стоп; трейлинг храповиком по закрытым барам
+    import numpy as np
+    n = len(high)
+    k0 = j + 1
+    run = trail_base[j]
+    kt = None
+    chunk = SCAN_CHUNK
+    while k0 < n:
+        k1 = min(n, k0 + chunk)
+        # стоп на баре k = max/min(stop0, экстремум trail_base[j..k-1])
+        if side > 0:
+            trail = np.maximum(np.maximum.accumulate(np.concatenate(([run], trail_base[k0:k1 - 1]))), stop0)
+            stop_hit = low[k0:k1] <= trail
+            tp_hit = None if kt is not None else high[k0:k1] >= tp
+        else:
+            trail = np.minimum(np.minimum.accumulate(np.concatenate(([run], trail_base[k0:k1 - 1]))), stop0)
+            stop_hit = high[k0:k1] >= trail
+            tp_hit = None if kt is not None else low[k0:k1] <= tp
+        if tp_hit is not None and tp_hit.any():
+            kt = k0 + int(tp_hit.argmax())
+        if stop_hit.any():
+            i = int(stop_hit.argmax())
+            return kt, k0 + i, float(trail[i])
+        last = trail_base[k1 - 1]
+        run = max(trail[-1], last) if side > 0 else min(trail[-1], last)
+        k0 = k1
+        chunk *= 4
+    return kt, None, 0.0
+
+def simulate_intrabar(df: pd.DataFrame, strat: Strategy, commission: float = COMMISSION, slippage: float = SLIPPAGE,
+                      initial: float = INITIAL_BALANCE, warm: Optional[int] = None, priority: str = "stop") -> BacktestResult:
+    # стопы/тейки по high/low бара; выходы ищутся numpy-поиском, python-цикл идёт только по сделкам
+    import numpy as np
+    if priority not in INTRABAR_PRIORITIES:
+        raise ValueError(f"unknown intrabar priority: {priority}")
+    if warm is None:
+        warm = warmup_bars(strat)
+    n = len(df)
+    bar_ts = bar_ts_ns(df)
+    sig = strat.signal_arrays(df)
+    side_arr = sig["side"]
+    op = df["open"].to_numpy(dtype="float64")
+    hi = df["high"].to_numpy(dtype="float64")
+    lo = df["low"].to_numpy(dtype="float64")
+    cl = df["close"].to_numpy(dtype="float64")
+    atr = df["atr"].to_numpy(dtype="float64")
+    trail_long = cl - atr*strat.map["atr_mult_trail"]
+    trail_short = cl + atr*strat.map["atr_mult_trail"]
+    risk_pct = float(strat.get("MAX_RISK_PER_TRADE", 0.01))
+    min_usdt = float(strat.get("MIN_ORDER_USDT", 10.0))
+    ratio = strat.map["partial_tp_ratio"]
+
+    balance = initial
+    trades = []
+    equity = np.empty(max(0, n - warm))
+    entries = np.flatnonzero(side_arr[warm:]) + warm if n > warm else np.array([], dtype="int64")
+
+    def mark(a: int, b: int, bal: float, side: int, qty: float, entry_px: float):
+        # equity на барах [a, b) с открытой позицией
+        if b <= a:
+            return
+        px = cl[a:b]
+        equity[a - warm:b - warm] = bal + (qty*px if side > 0 else qty*(2*entry_px - px))
 
-    curve = np.array(eq_curve) if eq_curve else np.array([10000.0, balance])
-    ret_pct = (curve[-1]/curve[0]-1)*100 if curve[0]>0 else 0.0
-    dd = calculate_drawdown(curve)*100
-    sh = calculate_sharpe(curve)
-    days = (df.index[-1] - df.index[0]).days or 1
-    annual_cagr = cagr(curve[0], curve[-1], days)
+    i = warm
+    while i < n:
+        nxt = np.searchsorted(entries, i)
+        if nxt >= len(entries):
+            equity[i - warm:] = balance
+            break
+        j = int(entries[nxt])
+        equity[i - warm:j - warm] = balance
 
+        side = int(side_arr[j])
+        name = "long" if side > 0 else "short"
+        price = cl[j]
+        usdt = strat.size_from_risk(balance, price, float(sig["stop_dist"][j]), risk_pct, min_usdt)
+        if usdt > balance:
+            usdt = balance
+        qty = usdt / price
+        entry_price = price*(1 + slippage if side > 0 else 1 - slippage)
+        entry_cost = qty*entry_price*(1 + commission)
+        if entry_cost > balance:
+            qty = balance / (entry_price*(1+commission))
+            entry_cost = balance
+        trades.append((int(bar_ts[j]), name, "open", qty, entry_price, entry_cost, None, "bt_entry"))
+        balance -= entry_cost
+        stop0, tp = float(sig["stop"][j]), float(sig["tp"][j])
+        tb = trail_long if side > 0 else trail_short
+
+        kt, ks, trail_px = _scan_exit(side, j, stop0, tp, tb, hi, lo)
+        if kt is not None and ks is not None and (kt > ks or (kt == ks and priority == "stop")):
+            kt = None
+        # партиальный тейк — один раз, по цене тейка (или открытия при гэпе)
+        if kt is not None:
+            mark(j, kt, balance, side, qty, entry_price)
+            close_qty = qty * ratio
+            fill = max(tp, op[kt]) if side > 0 else min(tp, op[kt])
+            if side > 0:
+                exit_price = fill*(1 - slippage)
+                pnl = (exit_price - entry_price)*close_qty - exit_price*close_qty*commission
+                balance += close_qty*exit_price
+            else:
+                exit_price = fill*(1 + slippage)
+                pnl = (entry_price - exit_price)*close_qty - exit_price*close_qty*commission
+                balance += close_qty*(2*entry_price - exit_price)
+            qty -= close_qty
+            trades.append((int(bar_ts[kt]), name, "partial_close", close_qty, exit_price, close_qty*exit_price, pnl, "bt_partial_tp"))
+            start = kt
+        else:
+            start = j
+
+        if ks is None:
+            mark(start, n, balance, side, qty, entry_price)
+            # close at last price
+            exit_price = cl[-1]
+            if side > 0:
+                pnl = (exit_price - entry_price)*qty - exit_price*qty*commission
+                balance += qty*exit_price
+            else:
+                pnl = (entry_price - exit_price)*qty - exit_price*qty*commission
+                balance += qty*(2*entry_price - exit_price)
+            trades.append((int(bar_ts[-1]), name, "close", qty, exit_price, qty*exit_price, pnl, "bt_final"))
+            break
+
+        mark(start, ks, balance, side, qty, entry_price)
+        # гэп за стоп — исполнение по открытию
+        fill = min(trail_px, op[ks]) if side > 0 else max(trail_px, op[ks])
+        if side > 0:
+            exit_price = fill*(1 - slippage)
+            pnl = (exit_price - entry_price)*qty - exit_price*qty*commission
+            balance += qty*exit_price
+        else:
+            exit_price = fill*(1 + slippage)
+            pnl = (entry_price - exit_price)*qty - exit_price*qty*commission
+            balance += qty*(2*entry_price - exit_price)
+        trades.append((int(bar_ts[ks]), name, "close", qty, exit_price, qty*exit_price, pnl, "bt_exit"))
+        equity[ks - warm] = balance
+        i = ks
+
+    if len(equity):
+        curve_ts = np.asarray(bar_ts[warm:], dtype="int64")
+    else:
+        equity = np.array([initial, balance])
+        curve_ts = np.asarray(bar_ts[[0, -1]] if len(bar_ts) else [0, 0], dtype="int64")
+    return BacktestResult(curve_ts, equity, trades, curve_metrics(equity, df))
+
+def curve_metrics(curve: np.ndarray, df: pd.DataFrame) -> dict:
+    from utils import calculate_drawdown, calculate_sharpe, cagr
+    days = ((df.index[-1] - df.index[0]).days or 1) if len(df) else 1
+    return {
+        "initial": float(curve[0]),
+        "final": float(curve[-1]),
+        "return_pct": float((curve[-1]/curve[0]-1)*100 if curve[0]>0 else 0.0),
+        "max_drawdown_pct": float(calculate_drawdown(curve)*100),
+        "sharpe": float(calculate_sharpe(curve)),
+        "cagr": float(cagr(curve[0], curve[-1], days)),
+    }
+
+def series_origin(df: pd.DataFrame) -> Tuple:
+    # отпечаток полного ряда, по которому посчитаны индикаторы среза
+    first_ts = int(bar_ts_ns(df)[0]) if len(df) else 0
+    return (first_ts,) + series_fingerprint(df)
+
+def backtest_key(cache: BacktestCache, df: pd.DataFrame, strat: Strategy, origin: Optional[Tuple] = None, **costs) -> str:
+    risk = {
+        "max_risk_per_trade": float(strat.get("MAX_RISK_PER_TRADE", 0.01)),
+        "min_order_usdt": float(strat.get("MIN_ORDER_USDT", 10.0)),
+    }
+    if origin is not None:
+        costs["origin"] = list(origin)
+    return cache.key(series_origin(df), strat.map, risk, costs)
+
+def cached_backtest(df: pd.DataFrame, strat: Strategy, cache: Optional[BacktestCache] = None, symbol: str = "", timeframe: str = "",
+                    commission: float = COMMISSION, slippage: float = SLIPPAGE, initial: float = INITIAL_BALANCE,
+                    warm: Optional[int] = None, fill_model: str = "close", priority: str = "stop",
+                    origin: Optional[Tuple] = None) -> Tuple[BacktestResult, bool]:
+    # (result, cache_hit); при попадании не считаем ни индикаторы, ни симуляцию.
+    # Срез с уже посчитанными индикаторами зависит от истории до него: кэшируем его только с origin
+    # (series_origin полного ряда + границы среза), иначе — без кэша
+    if fill_model not in FILL_MODELS:
+        raise ValueError(f"unknown fill model: {fill_model}")
+    if origin is None and "atr" in df.columns:
+        cache = None
+    key = None
+    if cache is not None:
+        key = backtest_key(cache, df, strat, origin, commission=commission, slippage=slippage, initial=initial, warm=warm,
+                           fill_model=fill_model, priority=priority if fill_model == "intrabar" else None)
+        res = cache.load(key)
+        if res is not None:
+            return res, True
+    if "atr" not in df.columns:
+        df = strat.compute_indicators(df, symbol, timeframe)
+    if fill_model == "intrabar":
+        res = simulate_intrabar(df, strat, commission=commission, slippage=slippage, initial=initial, warm=warm, priority=priority)
+    else:
+        res = simulate(df, strat, commission=commission, slippage=slippage, initial=initial, warm=warm)
+    if cache is not None:
+        cache.save(key, res)
+    return res, False
+
+async def run_backtest(symbol: str, timeframe: str, candles: int, cfg: dict, cache: Optional[BacktestCache] = None,
+                       fill_model: str = "close", priority: str = "stop"):
+    # миграция схемы (order_id/fee/fill_price в trades) — база может быть от предыдущей версии
+    init_db()
+    exchange = create_exchange(testnet=False, default_type=cfg.get("default_market_type","swap"))
+    df = await fetch_ohlcv(exchange, symbol, timeframe, limit=candles)
+    if df.empty:
+        print("No data for", symbol)
+        return
+
+    strat = Strategy(cfg.get("strategy", {}), param_getter=lambda k, d=None: cfg.get("risk", {}).get(k.lower(), d))
+    res, hit = cached_backtest(df, strat, cache, symbol, timeframe, fill_model=fill_model, priority=priority)
+    if hit:
+        print(f"Backtest cache hit ({cache.path}), simulation skipped.")
+    else:
+        run_id = create_run(f"backtest {symbol} {timeframe} {datetime.utcnow().isoformat()}")
+        for _, side, action, qty, price, value, pnl, info in res.trades:
+            log_trade(run_id, symbol, side, action, qty, price, value, pnl, info)
+
+    m = res.metrics
     print("Backtest result:")
-    print("Initial balance:", curve[0])
-    print("Final balance:", curve[-1])
-    print("Return %:", ret_pct)
-    print("Max drawdown %:", dd)
-    print("Sharpe (annualized):", sh)
-    print("CAGR:", annual_cagr)
+    print("Initial balance:", m["initial"])
+    print("Final balance:", m["final"])
+    print("Return %:", m["return_pct"])
+    print("Max drawdown %:", m["max_drawdown_pct"])
+    print("Sharpe (annualized):", m["sharpe"])
+    print("CAGR:", m["cagr"])
+    if cache is not None:
+        print("Cache:", cache.stats())
     # save curve
-    out = {"ts": df.index[warm:warm+len(curve)], "equity": curve}
     import pandas as pd
+    out = {"ts": pd.to_datetime(res.ts), "equity": res.equity}
     pd.DataFrame(out).to_csv(f"equity_{symbol.replace('/','')}_{timeframe}.csv", index=False)
     print("Equity curve saved.")
 
@@ -134,9 +381,39 @@ if __name__ == "__main__":
     parser.add_argument("timeframe")
     parser.add_argument("--candles", type=int, default=2000)
     parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш результатов")
+    parser.add_argument("--fill-model", choices=FILL_MODELS, default=None, help="close — по закрытию бара, intrabar — стопы/тейки по high/low")
+    parser.add_argument("--intrabar-priority", choices=INTRABAR_PRIORITIES, default=None, help="что раньше, если стоп и тейк в одном баре")
+    parser.add_argument("--walk-forward", action="store_true", help="walk-forward оптимизация по сетке walk_forward.grid")
+    parser.add_argument("--is-bars", type=int, default=None)
+    parser.add_argument("--oos-bars", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=0, help="процессов для walk-forward (0 — по числу CPU)")
+    parser.add_argument("--profile", action="store_true", help="профилировать прогон без кэша результатов, отчёты в PROFILE_DIR (для walk-forward — с --workers 1)")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default="sample")
     args = parser.parse_args()
     cfg = {}
+    import yaml
     if os.path.exists(args.config):
         with open(args.config, "r") as f:
             cfg = yaml.safe_load(f)
-    asyncio.run(run_backtest(args.symbol.upper(), args.timeframe, args.candles, cfg))
+    # при профилировании кэш результатов отключён — иначе повторный прогон профилирует чтение кэша
+    cache = None if args.no_cache or args.profile else BacktestCache()
+    bt_cfg = cfg.get("backtest", {}) or {}
+    fill_model = args.fill_model or bt_cfg.get("fill_model", "close")
+    priority = args.intrabar_priority or bt_cfg.get("intrabar_priority", "stop")
+    if args.profile:
+        PROFILER.start(args.profile_mode)
+    try:
+        if args.walk_forward:
+            from walkforward import run_walk_forward
+            asyncio.run(run_walk_forward(args.symbol.upper(), args.timeframe, args.candles, cfg, cache,
+                                         workers=args.workers, is_bars=args.is_bars, oos_bars=args.oos_bars,
+                                         fill_model=fill_model, priority=priority))
+        else:
+            asyncio.run(run_backtest(args.symbol.upper(), args.timeframe, args.candles, cfg, cache, fill_model, priority))
+    finally:
+        if args.profile:
+            paths = PROFILER.stop(tag=f"backtest_{args.symbol.upper().replace('/','')}_{args.timeframe}")
+            with open(paths["stages"], encoding="utf-8") as f:
+                print(f.read())
+            print("Profile saved:", os.path.dirname(paths["stages"]))
@@ -0,0 +1,99 @@
+﻿# backtest_cache.py
+from __future__ import annotations
+import os
+import json
+import hashlib
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# bump when simulate() semantics change — старые записи просто перестанут совпадать
+ENGINE_VERSION = "1"
+
+# (bar_ts_ns, side, action, qty, price, usdt_value, pnl, info)
+Trade = Tuple[int, str, str, float, float, float, Optional[float], str]
+
+@dataclass
+class BacktestResult:
+    ts: np.ndarray
+    equity: np.ndarray
+    trades: List[Trade] = field(default_factory=list)
+    metrics: Dict[str, Any] = field(default_factory=dict)
+
+def _digest(obj: Any) -> str:
+    blob = json.dumps(obj, sort_keys=True, default=str).encode()
+    return hashlib.sha256(blob).hexdigest()
+
+class BacktestCache:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("BT_CACHE_DIR", ".bt_cache")
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, fingerprint: Any, strategy_params: Dict[str, Any], risk_params: Dict[str, Any], costs: Dict[str, Any]) -> str:
+        return _digest({
+            "engine": ENGINE_VERSION,
+            "data": fingerprint,
+            "strategy": strategy_params,
+            "risk": risk_params,
+            "costs": costs,
+        })
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.npz")
+
+    def load(self, key: str) -> Optional[BacktestResult]:
+        import numpy as np
+        fn = self._file(key)
+        if not os.path.exists(fn):
+            self.misses += 1
+            return None
+        try:
+            with np.load(fn, allow_pickle=False) as z:
+                # NpzFile распаковывает массив при каждом обращении — читаем каждый один раз
+                ts, equity, metrics = z["ts"], z["equity"], str(z["metrics"])
+                trade_ts = z["trade_ts"].tolist()
+                num = z["trade_num"].tolist()
+                txt = z["trade_txt"].tolist()
+            trades = []
+            for t, (qty, price, value, pnl), (side, action, info) in zip(trade_ts, num, txt):
+                trades.append((t, side, action, qty, price, value, None if pnl != pnl else pnl, info))
+            res = BacktestResult(ts, equity, trades, json.loads(metrics))
+        except Exception:
+            # битый/старый файл — считаем промахом и пересчитываем
+            self.misses += 1
+            return None
+        self.hits += 1
+        return res
+
+    def save(self, key: str, res: BacktestResult):
+        import numpy as np
+        fn = self._file(key)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        n = len(res.trades)
+        trade_ts = np.array([t[0] for t in res.trades], dtype="int64")
+        trade_num = np.array([[t[3], t[4], t[5], np.nan if t[6] is None else t[6]] for t in res.trades], dtype="float64").reshape(n, 4)
+        trade_txt = np.array([[t[1], t[2], t[7]] for t in res.trades], dtype=str).reshape(n, 3)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fn), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    ts=np.asarray(res.ts, dtype="int64"),
+                    equity=np.asarray(res.equity, dtype="float64"),
+                    trade_ts=trade_ts,
+                    trade_num=trade_num,
+                    trade_txt=trade_txt,
+                    metrics=np.array(json.dumps(res.metrics, default=float)),
+                )
+            os.replace(tmp, fn)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,50 +1,95 @@
+from __future__ import annotations
 import os
 import logging
 import asyncio
-from dotenv import load_dotenv
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, Bot
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from typing import Optional, TYPE_CHECKING
+
+# telegram/ccxt/pandas грузятся лениво — импорт модуля не должен стоить секунды
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
 
 from crypto_manager import CryptoManager
-from db import init_db, add_pair, remove_pair, list_trades, create_run
-from exchange import create_exchange, fetch_ohlcv
-from strategy import Strategy
-from exec_layer import ExecLayer
-from pairs_loader import load_pairs, save_pairs   # 👈 загрузка/сохранение пар
-
-load_dotenv()
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+from db import init_db, list_trades, log_signal, run_retention
+from exchange import create_exchange, fetch_ohlcv, TickerCache
+from indicator_cache import INDICATOR_CACHE, env_max_bytes
+from variants import Variant, build_variants
+from notifier import TelegramNotifier
+from profiler import PROFILER, PROFILE_MODES, stage
+from pair_registry import PairRegistry, pair_key   # 👈 пары в памяти + pairs.json
+
 log = logging.getLogger("bybit_bot")
 
-# read env
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
-TESTNET = os.getenv("TESTNET", "true").lower() in ("1","true","yes")
-MODE = os.getenv("MODE", "paper")
-DEFAULT_MARKET_TYPE = os.getenv("DEFAULT_MARKET_TYPE", "swap")
-
-# init db
-default_params = {}
-init_db(default_params)
-
-crypto = CryptoManager()
-API_KEY = os.getenv("API_KEY", "")
-API_SECRET = os.getenv("API_SECRET", "")
-if not API_KEY and os.getenv("ENCRYPTED_API_KEY"):
-    try:
-        API_KEY = crypto.decrypt(os.getenv("ENCRYPTED_API_KEY"))
-        API_SECRET = crypto.decrypt(os.getenv("ENCRYPTED_API_SECRET")) if os.getenv("ENCRYPTED_API_SECRET") else ""
-    except Exception as e:
-        log.warning("Не удалось расшифровать API_KEY: %s", e)
+# заполняются в init_app()
+TELEGRAM_TOKEN = ""
+TELEGRAM_CHAT_ID = ""
+TESTNET = True
+MODE = "paper"
+DEFAULT_MARKET_TYPE = "swap"
+RETENTION_DAYS = 0  # 0 — архивация выключена
+POLL_INTERVAL = 30.0  # опрос свечей, сек
+INTRABAR_STOPS = False  # проверять стопы/тейки по тикеру между опросами свечей
+TICK_INTERVAL = 5.0
+
+crypto = None
+exchange = None
+tickers = None
+bot = None
+notifier = None
 
-exchange = create_exchange(API_KEY, API_SECRET, testnet=TESTNET, default_type=DEFAULT_MARKET_TYPE)
-bot = Bot(token=TELEGRAM_TOKEN) if TELEGRAM_TOKEN else None
+def init_app():
+    # все побочные эффекты старта: .env, логирование, БД, ключи, биржа, Telegram
+    global TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, TESTNET, MODE, DEFAULT_MARKET_TYPE, RETENTION_DAYS
+    global POLL_INTERVAL, INTRABAR_STOPS, TICK_INTERVAL
+    global crypto, exchange, tickers, bot, notifier
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+
+    # read env
+    TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
+    TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
+    TESTNET = os.getenv("TESTNET", "true").lower() in ("1","true","yes")
+    MODE = os.getenv("MODE", "paper")
+    DEFAULT_MARKET_TYPE = os.getenv("DEFAULT_MARKET_TYPE", "swap")
+    RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+    POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "30"))
+    INTRABAR_STOPS = os.getenv("INTRABAR_STOPS", "false").lower() in ("1","true","yes")
+    TICK_INTERVAL = float(os.getenv("TICK_INTERVAL", "5"))
+    INDICATOR_CACHE.resize(env_max_bytes())
+
+    # init db
+    default_params = {}
+    init_db(default_params)
+
+    crypto = CryptoManager()
+    api_key = os.getenv("API_KEY", "")
+    api_secret = os.getenv("API_SECRET", "")
+    if not api_key and os.getenv("ENCRYPTED_API_KEY"):
+        try:
+            api_key = crypto.decrypt(os.getenv("ENCRYPTED_API_KEY"))
+            api_secret = crypto.decrypt(os.getenv("ENCRYPTED_API_SECRET")) if os.getenv("ENCRYPTED_API_SECRET") else ""
+        except Exception as e:
+            log.warning("Не удалось расшифровать API_KEY: %s", e)
+
+    exchange = create_exchange(api_key, api_secret, testnet=TESTNET, default_type=DEFAULT_MARKET_TYPE)
+    tickers = TickerCache(exchange, ttl=TICK_INTERVAL / 2)
+    if TELEGRAM_TOKEN:
+        from telegram import Bot
+        bot = Bot(token=TELEGRAM_TOKEN)
+    if os.getenv("PROFILE", "false").lower() in ("1","true","yes"):
+        PROFILER.start(os.getenv("PROFILE_MODE", "sample"))
+    # chat_id как есть: PTB принимает и числовой id, и @username канала
+    notifier = TelegramNotifier(bot, TELEGRAM_CHAT_ID, min_interval=float(os.getenv("TG_MIN_INTERVAL", "1.0"))) if bot and TELEGRAM_CHAT_ID else None
 
 RUNNING = False
 PAIR_TASKS = {}
+ACTIVE_RUNS = set()  # run_id вариантов запущенных мониторов — retention их не архивирует
+PAIRS = PairRegistry()
 
 # Telegram UI
 def main_keyboard():
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("🔄 Статус", callback_data="status"), InlineKeyboardButton("📊 Отчёт", callback_data="report")],
         [InlineKeyboardButton("▶️ Запустить", callback_data="start"), InlineKeyboardButton("⏹️ Остановить", callback_data="stop")],
@@ -54,14 +99,12 @@ def main_keyboard():
         [InlineKeyboardButton("❓ Помощь", callback_data="help")]
     ])
 
-async def tg_send(text: str, reply_markup=None):
-    if not bot or not TELEGRAM_CHAT_ID:
+def tg_send(text: str, reply_markup=None):
+    # не блокирует: сообщение уходит в очередь notifier
+    if not notifier:
         log.info("TG: %s", text)
         return
-    try:
-        await bot.send_message(chat_id=int(TELEGRAM_CHAT_ID), text=text, reply_markup=reply_markup)
-    except Exception as e:
-        log.exception("TG send error: %s", e)
+    notifier.send(text, reply_markup=reply_markup)
 
 # handlers
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -77,14 +120,17 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📈 PnL — показать открытые позиции и доходность\n"
         "▶️ Запустить / ⏹️ Остановить — управление мониторингом\n"
         "➕ / ➖ — добавить или удалить пару\n"
-        "🔁 Перезагрузить пары — перечитать файл pairs.json"
+        "🔁 Перезагрузить пары — перечитать файл pairs.json\n"
+        "/profile [on|off] [sample|cprofile] — профилирование, отчёт в PROFILE_DIR"
     )
     await update.effective_message.reply_text(txt, reply_markup=main_keyboard())
 
 async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    pairs = load_pairs()
+    pairs = PAIRS.pairs()
     pairs_text = ", ".join([f"{s}({t})" for s, t in pairs]) or "—"
     txt = f"📌 Статус: {'🟢 РАБОТАЕТ' if RUNNING else '🔴 ОСТАНОВЛЕН'}\n📊 Пары: {pairs_text}"
+    cs = INDICATOR_CACHE.stats()
+    txt += f"\n🧮 Кэш индикаторов: {cs['hits']} hit / {cs['misses']} miss, {cs['bytes'] // 1024} KB"
     await update.effective_message.reply_text(txt, reply_markup=main_keyboard())
 
 async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -92,7 +138,7 @@ async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.effective_message.reply_text(f"📑 Сделок в базе: {len(trades)}", reply_markup=main_keyboard())
 
 async def show_pairs_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    pairs = load_pairs()
+    pairs = PAIRS.pairs()
     if not pairs:
         txt = "⚠️ Нет пар. Добавь их через меню или файл pairs.json"
     else:
@@ -139,8 +185,28 @@ async def pnl_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         txt = f"❌ Ошибка получения PnL: {e}"
     await update.effective_message.reply_text(txt, reply_markup=main_keyboard())
 
+async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = [a.lower() for a in (context.args or [])]
+    want = args[0] if args and args[0] in ("on", "off") else ("off" if PROFILER.enabled else "on")
+    if want == "on":
+        mode = next((a for a in args if a in PROFILE_MODES), "sample")
+        if PROFILER.enabled:
+            txt = f"⚠️ Профилирование уже идёт ({PROFILER.mode})"
+        else:
+            PROFILER.start(mode)
+            txt = f"🩺 Профилирование включено ({mode}). /profile off — сохранить отчёт"
+    elif not PROFILER.enabled:
+        txt = "⚠️ Профилирование не запущено"
+    else:
+        # снимаем профайлер в потоке event loop, в отдельный поток — только запись отчётов
+        paths = await asyncio.to_thread(PROFILER.write, PROFILER.halt(), None, "live")
+        with open(paths["stages"], encoding="utf-8") as f:
+            txt = f"🩺 Профиль сохранён: {os.path.dirname(paths['stages'])}\n{f.read()}"
+    await update.effective_message.reply_text(txt, reply_markup=main_keyboard())
+
 # buttons
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     query = update.callback_query
     await query.answer()
     data = query.data
@@ -181,8 +247,12 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["awaiting_input"] = "remove_pair"
         return
     if data == "reload_pairs":
-        pairs = load_pairs()
-        await query.edit_message_text(f"🔁 Пары перезагружены: {[s for s,t in pairs]}", reply_markup=main_keyboard())
+        pairs = PAIRS.reload()
+        started, stopped = sync_monitors()
+        txt = f"🔁 Пары перезагружены: {[s for s,t in pairs]}"
+        if PAIRS.broken:
+            txt = f"⚠️ Ошибка в pairs.json — оставлены текущие пары: {[s for s,t in pairs]}"
+        await query.edit_message_text(txt + sync_text(started, stopped), reply_markup=main_keyboard())
         return
     if data == "help":
         await help_cmd(update, context); return
@@ -194,82 +264,158 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parts = txt.split()
         symbol = parts[0].upper()
         timeframe = parts[1] if len(parts) > 1 else os.getenv("TIMEFRAME", "15m")
-        pairs = load_pairs()
-        pairs.append((symbol, timeframe))
-        save_pairs(pairs)
-        add_pair(symbol, timeframe)  # в БД тоже
-        await update.message.reply_text(f"✅ Добавлена пара: {symbol} {timeframe}", reply_markup=main_keyboard())
+        added = PAIRS.add(symbol, timeframe)
+        started, stopped = sync_monitors()
+        msg = f"✅ Добавлена пара: {symbol} {timeframe}" if added else f"⚠️ Пара уже есть: {symbol} {timeframe}"
+        await update.message.reply_text(msg + sync_text(started, stopped), reply_markup=main_keyboard())
         context.user_data.pop("awaiting_input", None)
         return
     if action == "remove_pair":
         symbol = txt.upper()
-        pairs = [(s,t) for s,t in load_pairs() if s != symbol]
-        save_pairs(pairs)
-        remove_pair(symbol)  # в БД тоже
-        await update.message.reply_text(f"❌ Удалена пара: {symbol}", reply_markup=main_keyboard())
+        PAIRS.remove(symbol)
+        started, stopped = sync_monitors()
+        await update.message.reply_text(f"❌ Удалена пара: {symbol}" + sync_text(started, stopped), reply_markup=main_keyboard())
         context.user_data.pop("awaiting_input", None)
         return
     await update.message.reply_text("❓ Используй меню", reply_markup=main_keyboard())
 
-# monitoring loop (без изменений)
+# monitoring loop
+def exit_hit(pos: dict, price: float) -> bool:
+    if pos["side"] == "long":
+        return price <= pos["stop"] or price >= pos["tp"]
+    return price >= pos["stop"] or price <= pos["tp"]
+
+def notify(v: Variant, text: str):
+    if v.live:
+        tg_send(text)
+        return
+    log.info("[shadow:%s] %s", v.name, text)
+
+async def step_variant(v: Variant, symbol: str, timeframe: str, df):
+    df = v.strat.compute_indicators(df, symbol, timeframe)
+    sig = v.strat.generate_signal(df, equity_usdt=10000.0)
+    price = float(df.iloc[-1]["close"])
+    bar_ts = df.index[-1]
+    if sig.side != "hold" and v.last_signal_ts != bar_ts:
+        v.last_signal_ts = bar_ts
+        log_signal(v.execL.run_id, symbol, sig.side, price, sig.stop_price, sig.tp_price, sig.info.get("reason", ""))
+    with stage("position"):
+        if not v.pos and sig.side != "hold":
+            usdt = sig.info["usdt_size"]
+            ok, msg, qty, px = await v.execL.open(symbol, sig.side, usdt, price=fill_price(v, price))
+            if ok:
+                v.pos = {"side": sig.side, "qty": qty, "entry": px, "stop": sig.stop_price, "tp": sig.tp_price}
+                notify(v, f"📈 Открыта позиция {symbol} {sig.side} {qty}@{px}")
+        elif v.pos and exit_hit(v.pos, price):
+            await close_variant(v, symbol, price, fill_price(v, price))
+
+def fill_price(v: Variant, price: float):
+    # теневые варианты исполняются по цене свечи; основной, как и раньше, по тикеру (paper) или рынку (live)
+    return None if v.live else price
+
+async def close_variant(v: Variant, symbol: str, price: float, fill: Optional[float]):
+    await v.execL.close(symbol, v.pos["side"], v.pos["qty"], price=fill)
+    kind = "лонг" if v.pos["side"] == "long" else "шорт"
+    notify(v, f"📉 Закрыт {kind} {symbol} {v.pos['qty']}@{price}")
+    v.pos = None
+
+async def wait_next_poll(variants, symbol: str):
+    # до следующего опроса свечей; в режиме INTRABAR_STOPS стопы/тейки проверяются по кэшу тикеров
+    if not INTRABAR_STOPS:
+        await asyncio.sleep(POLL_INTERVAL)
+        return
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + POLL_INTERVAL
+    while RUNNING:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(TICK_INTERVAL, remaining))
+        open_variants = [v for v in variants if v.pos]
+        if not open_variants:
+            continue
+        price = await tickers.last(symbol)
+        if price <= 0:
+            continue
+        for v in open_variants:
+            if exit_hit(v.pos, price):
+                try:
+                    # цена уже тикерная — повторно тикер не запрашиваем (в live исполняется по рынку)
+                    await close_variant(v, symbol, price, price)
+                except Exception as e:
+                    log.exception("Ошибка закрытия %s %s: %s", v.name, symbol, e)
+
 async def monitor_pair(symbol: str, timeframe: str):
     log.info("Запущен мониторинг %s %s", symbol, timeframe)
-    strat_cfg = {}
+    cfg = {}
     import yaml
     if os.path.exists("config.yaml"):
         with open("config.yaml", "r") as f:
-            cfg = yaml.safe_load(f)
-            strat_cfg = cfg.get("strategy", {})
+            cfg = yaml.safe_load(f) or {}
 
-    strat = Strategy(strat_cfg, param_getter=lambda k, d=None: os.getenv(k, d))
-    execL = ExecLayer(exchange, MODE, create_run(f"run {MODE} {symbol}"))
-    pos = None
+    # основной + теневые варианты на одном буфере свечей
+    variants = build_variants(cfg, exchange, MODE, symbol)
+    if len(variants) > 1:
+        log.info("%s: теневые варианты %s", symbol, [v.name for v in variants if not v.live])
+    run_ids = {v.execL.run_id for v in variants}
+    ACTIVE_RUNS.update(run_ids)
 
-    while RUNNING:
-        try:
-            df = await fetch_ohlcv(exchange, symbol, timeframe, limit=500)
-            if df.empty:
-                await asyncio.sleep(10); continue
-            df = strat.compute_indicators(df)
-            sig = strat.generate_signal(df, equity_usdt=10000.0)
-            price = float(df.iloc[-1]["close"])
-            if not pos and sig.side != "hold":
-                usdt = sig.info["usdt_size"]
-                ok, msg, qty, px = await execL.open(symbol, sig.side, usdt)
-                if ok:
-                    pos = {"side": sig.side, "qty": qty, "entry": px, "stop": sig.stop_price, "tp": sig.tp_price}
-                    await tg_send(f"📈 Открыта позиция {symbol} {sig.side} {qty}@{px}")
-            elif pos:
-                if pos["side"]=="long":
-                    if price <= pos["stop"] or price >= pos["tp"]:
-                        await execL.close(symbol, pos["side"], pos["qty"])
-                        await tg_send(f"📉 Закрыт лонг {symbol} {pos['qty']}@{price}")
-                        pos = None
-                else:
-                    if price >= pos["stop"] or price <= pos["tp"]:
-                        await execL.close(symbol, pos["side"], pos["qty"])
-                        await tg_send(f"📉 Закрыт шорт {symbol} {pos['qty']}@{price}")
-                        pos = None
-        except Exception as e:
-            log.exception("Ошибка мониторинга %s: %s", symbol, e)
-        await asyncio.sleep(30)
+    try:
+        while RUNNING:
+            try:
+                df = await fetch_ohlcv(exchange, symbol, timeframe, limit=500)
+                if df.empty:
+                    await asyncio.sleep(10); continue
+                for v in variants:
+                    try:
+                        await step_variant(v, symbol, timeframe, df)
+                    except Exception as e:
+                        log.exception("Ошибка варианта %s %s: %s", v.name, symbol, e)
+            except Exception as e:
+                log.exception("Ошибка мониторинга %s: %s", symbol, e)
+            await wait_next_poll(variants, symbol)
+    finally:
+        ACTIVE_RUNS.difference_update(run_ids)
+        if tickers is not None:
+            tickers.forget(symbol)
     log.info("Мониторинг остановлен %s", symbol)
 
+def sync_monitors():
+    # сверяет реестр пар с PAIR_TASKS: запускает новые и гасит удалённые, остальные не трогает
+    if not RUNNING:
+        return [], []
+    wanted = {pair_key(s, t): (s, t) for s, t in PAIRS.pairs()}
+    stopped = []
+    for key, t in list(PAIR_TASKS.items()):
+        if key not in wanted or t.done():
+            t.cancel()
+            PAIR_TASKS.pop(key)
+            if key not in wanted:
+                stopped.append(key)
+    started = []
+    for key, (symbol, timeframe) in wanted.items():
+        if key not in PAIR_TASKS:
+            PAIR_TASKS[key] = asyncio.create_task(monitor_pair(symbol, timeframe))
+            started.append(key)
+    return started, stopped
+
+def sync_text(started, stopped) -> str:
+    if not started and not stopped:
+        return ""
+    return f"\n▶️ Запущено: {len(started)}, ⏹️ остановлено: {len(stopped)}"
+
 async def start_monitors():
-    global RUNNING, PAIR_TASKS
-    pairs = load_pairs()
-    if not pairs:
-        await tg_send("⚠️ Пары не загружены. Добавь их в pairs.json или через меню.")
+    global RUNNING
+    if not PAIRS.pairs():
+        RUNNING = False
+        tg_send("⚠️ Пары не загружены. Добавь их в pairs.json или через меню.")
         return
     RUNNING = True
-    PAIR_TASKS = {}
-    for symbol, timeframe in pairs:
-        t = asyncio.create_task(monitor_pair(symbol, timeframe))
-        PAIR_TASKS[f"{symbol}|{timeframe}"] = t
-    await tg_send(f"▶️ Запущен мониторинг {len(PAIR_TASKS)} пар.")
+    sync_monitors()
+    tg_send(f"▶️ Запущен мониторинг {len(PAIR_TASKS)} пар.")
 
 async def stop_monitors():
-    global RUNNING, PAIR_TASKS
+    global RUNNING
     RUNNING = False
     for _, t in list(PAIR_TASKS.items()):
         try:
@@ -277,23 +423,46 @@ async def stop_monitors():
         except Exception:
             pass
     PAIR_TASKS.clear()
-    await tg_send("⏹️ Мониторинг остановлен.")
+    tg_send("⏹️ Мониторинг остановлен.")
+
+async def retention_loop():
+    while True:
+        try:
+            stats = await asyncio.to_thread(run_retention, RETENTION_DAYS, None, set(ACTIVE_RUNS))
+            if stats["runs"]:
+                log.info("Архивировано прогонов: %s, сделок: %s, сигналов: %s", stats["runs"], stats["trades"], stats["signals"])
+        except Exception as e:
+            log.exception("Ошибка архивации: %s", e)
+        await asyncio.sleep(24 * 3600)
 
 def main():
+    init_app()
     if not TELEGRAM_TOKEN:
         print("TELEGRAM_TOKEN не задан — проверь .env")
         return
+    from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters
     app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("status", status_cmd))
     app.add_handler(CommandHandler("report", report_cmd))
+    app.add_handler(CommandHandler("profile", profile_cmd))
     app.add_handler(CallbackQueryHandler(button_handler))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
 
     async def on_startup(app_):
-        await tg_send("🤖 Бот запущен", reply_markup=main_keyboard())
+        if notifier:
+            notifier.start()
+        tg_send("🤖 Бот запущен", reply_markup=main_keyboard())
+        if RETENTION_DAYS > 0:
+            asyncio.create_task(retention_loop())
+    async def on_shutdown(app_):
+        if PROFILER.enabled:
+            PROFILER.stop(tag="live")
+        if notifier:
+            await notifier.stop()
     app.post_init = on_startup
+    app.post_shutdown = on_shutdown
     app.run_polling()
 
 if __name__ == "__main__":
@@ -1,5 +1,4 @@
 ﻿# crypto_manager.py
-from cryptography.fernet import Fernet
 import os
 import logging
 
@@ -7,6 +6,7 @@ log = logging.getLogger("bybit_bot.crypto")
 
 class CryptoManager:
     def __init__(self):
+        from cryptography.fernet import Fernet
         key = os.getenv("CRYPTO_KEY")
         if not key:
             key = Fernet.generate_key().decode()
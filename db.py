@@ -1,17 +1,29 @@
 ﻿# db.py
 import sqlite3
 import os
-from datetime import datetime
+import json
+import gzip
+import zlib
+from datetime import datetime, timedelta
 from typing import Any, Optional, List, Dict, Tuple
 
+from profiler import profiled
+
 DB_PATH = os.getenv("DB_PATH", "bybit_bot.db")
 
+# info длиннее этого — сырой ответ биржи (str(order)) из старых версий, переносим в trade_payloads
+LEGACY_INFO_LEN = 64
+
 def _conn():
     return sqlite3.connect(DB_PATH, check_same_thread=False)
 
 def init_db(default_strategy_params: Dict[str, Any] = None):
     conn = _conn()
     cur = conn.cursor()
+    # incremental auto_vacuum нужен для compact_db(); на существующей базе включается через VACUUM
+    if cur.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        cur.execute("VACUUM;")
     cur.execute("PRAGMA journal_mode=WAL;")
     cur.execute("""
         CREATE TABLE IF NOT EXISTS strategy_params (
@@ -38,9 +50,34 @@ def init_db(default_strategy_params: Dict[str, Any] = None):
             price REAL,
             usdt_value REAL,
             pnl_usdt REAL,
+            info TEXT,
+            order_id TEXT,
+            fee REAL,
+            fill_price REAL
+        )
+    """)
+    _ensure_columns(cur, "trades", {"order_id": "TEXT", "fee": "REAL", "fill_price": "REAL"})
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS trade_payloads (
+            trade_id INTEGER PRIMARY KEY,
+            payload BLOB -- zlib(json(order))
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS signals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER,
+            ts TEXT,
+            symbol TEXT,
+            side TEXT,
+            price REAL,
+            stop_price REAL,
+            tp_price REAL,
             info TEXT
         )
     """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_run ON trades(run_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_signals_run ON signals(run_id)")
     cur.execute("""
         CREATE TABLE IF NOT EXISTS pairs (
             symbol TEXT PRIMARY KEY,
@@ -48,6 +85,7 @@ def init_db(default_strategy_params: Dict[str, Any] = None):
         )
     """)
     conn.commit()
+    _migrate_legacy_info(conn)
 
     # insert default strategy params if given
     if default_strategy_params:
@@ -56,6 +94,27 @@ def init_db(default_strategy_params: Dict[str, Any] = None):
         conn.commit()
     conn.close()
 
+def _ensure_columns(cur, table: str, columns: Dict[str, str]):
+    existing = {r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+    for name, typ in columns.items():
+        if name not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {typ}")
+
+def _pack(payload: Any) -> bytes:
+    return zlib.compress(json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8"), 6)
+
+def _unpack(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+def _migrate_legacy_info(conn):
+    rows = conn.execute("SELECT id, info FROM trades WHERE length(info) > ?", (LEGACY_INFO_LEN,)).fetchall()
+    if not rows:
+        return
+    conn.executemany("INSERT OR REPLACE INTO trade_payloads(trade_id, payload) VALUES(?,?)",
+                     [(tid, _pack({"raw": info})) for tid, info in rows])
+    conn.executemany("UPDATE trades SET info='live' WHERE id=?", [(tid,) for tid, _ in rows])
+    conn.commit()
+
 def get_param(name: str) -> Optional[str]:
     conn = _conn()
     row = conn.execute("SELECT value FROM strategy_params WHERE name=?", (name,)).fetchone()
@@ -70,6 +129,7 @@ def set_param(name: str, value: Any):
     conn.commit()
     conn.close()
 
+@profiled("db")
 def create_run(description: str) -> int:
     conn = _conn()
     cur = conn.cursor()
@@ -79,11 +139,39 @@ def create_run(description: str) -> int:
     conn.close()
     return run_id
 
-def log_trade(run_id: Optional[int], symbol: str, side: str, action: str, qty: float, price: float, usdt_value: float, pnl: Optional[float], info: str = ""):
+@profiled("db")
+def log_trade(run_id: Optional[int], symbol: str, side: str, action: str, qty: float, price: float, usdt_value: float, pnl: Optional[float], info: str = "", order: Optional[Dict[str, Any]] = None) -> int:
+    # в trades — только типизированные поля ордера; полный ответ биржи сжимается в trade_payloads
+    order_id = fee = fill_price = None
+    if order:
+        order_id = order.get("id")
+        fee = (order.get("fee") or {}).get("cost")
+        fill_price = order.get("average") or order.get("price")
+    conn = _conn()
+    cur = conn.execute(
+        "INSERT INTO trades(run_id,ts,symbol,side,action,qty,price,usdt_value,pnl_usdt,info,order_id,fee,fill_price) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        (run_id, datetime.utcnow().isoformat(), symbol, side, action, qty, price, usdt_value, pnl, info,
+         str(order_id) if order_id is not None else None, fee, fill_price)
+    )
+    trade_id = cur.lastrowid
+    if order:
+        conn.execute("INSERT INTO trade_payloads(trade_id, payload) VALUES(?,?)", (trade_id, _pack(order)))
+    conn.commit()
+    conn.close()
+    return trade_id
+
+def get_trade_payload(trade_id: int) -> Optional[Dict[str, Any]]:
+    conn = _conn()
+    row = conn.execute("SELECT payload FROM trade_payloads WHERE trade_id=?", (trade_id,)).fetchone()
+    conn.close()
+    return _unpack(row[0]) if row else None
+
+@profiled("db")
+def log_signal(run_id: Optional[int], symbol: str, side: str, price: float, stop_price: float, tp_price: float, info: str = ""):
     conn = _conn()
     conn.execute(
-        "INSERT INTO trades(run_id,ts,symbol,side,action,qty,price,usdt_value,pnl_usdt,info) VALUES(?,?,?,?,?,?,?,?,?,?)",
-        (run_id, datetime.utcnow().isoformat(), symbol, side, action, qty, price, usdt_value, pnl, info)
+        "INSERT INTO signals(run_id,ts,symbol,side,price,stop_price,tp_price,info) VALUES(?,?,?,?,?,?,?,?)",
+        (run_id, datetime.utcnow().isoformat(), symbol, side, price, stop_price, tp_price, info)
     )
     conn.commit()
     conn.close()
@@ -101,6 +189,12 @@ def remove_pair(symbol: str):
     conn.commit()
     conn.close()
 
+def clear_pairs():
+    conn = _conn()
+    conn.execute("DELETE FROM pairs")
+    conn.commit()
+    conn.close()
+
 def list_pairs() -> List[Tuple[str,str]]:
     conn = _conn()
     rows = conn.execute("SELECT symbol, timeframe FROM pairs").fetchall()
@@ -112,3 +206,78 @@ def list_trades(limit: int = 1000):
     rows = conn.execute("SELECT * FROM trades ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
     conn.close()
     return rows
+
+# retention
+def _archive_dir(archive_dir: Optional[str] = None) -> str:
+    # env читается при вызове: bot.init_app() грузит .env уже после импорта db
+    return archive_dir or os.getenv("ARCHIVE_DIR", "archive")
+
+def _stale_runs(conn, cutoff: str, keep) -> List[Optional[int]]:
+    # прогон устарел, если ни сам прогон, ни его сделки/сигналы не новее cutoff;
+    # прогоны активных мониторов и с открытой позицией (последнее действие open/partial_close) не трогаем
+    last_ts = conn.execute("""
+        SELECT run_id FROM (
+            SELECT id AS run_id, ts FROM runs
+            UNION ALL SELECT run_id, ts FROM trades
+            UNION ALL SELECT run_id, ts FROM signals
+        ) GROUP BY run_id HAVING MAX(ts) < ?
+    """, (cutoff,)).fetchall()
+    still_open = {r[0] for r in conn.execute(
+        "SELECT run_id FROM trades WHERE id IN (SELECT MAX(id) FROM trades GROUP BY run_id) "
+        "AND action IN ('open','partial_close')").fetchall()}
+    return [r[0] for r in last_ts if r[0] not in still_open and r[0] not in keep]
+
+def _dump_rows(f, table: str, cur):
+    cols = [d[0] for d in cur.description]
+    n = 0
+    for row in cur:
+        rec = {"table": table}
+        rec.update(zip(cols, row))
+        if rec.get("payload") is not None:
+            rec["payload"] = _unpack(rec["payload"])
+        f.write(json.dumps(rec, default=str, ensure_ascii=False) + "\n")
+        n += 1
+    return n
+
+def archive_runs(older_than_days: int, archive_dir: Optional[str] = None, active_runs=()) -> Dict[str, int]:
+    # устаревшие прогоны уходят в archive_dir/run_<id>_<ts>.jsonl.gz (строки runs, trades, signals с полем table)
+    # и удаляются из горячих таблиц
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+    archive_dir = _archive_dir(archive_dir)
+    conn = _conn()
+    run_ids = _stale_runs(conn, cutoff, set(active_runs))
+    stats = {"runs": 0, "trades": 0, "signals": 0}
+    if run_ids:
+        os.makedirs(archive_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    for run_id in run_ids:
+        fn = os.path.join(archive_dir, f"run_{run_id}_{stamp}.jsonl.gz")
+        with gzip.open(fn, "wt", encoding="utf-8") as f:
+            _dump_rows(f, "runs", conn.execute("SELECT * FROM runs WHERE id IS ?", (run_id,)))
+            trades = _dump_rows(f, "trades", conn.execute(
+                "SELECT t.*, p.payload FROM trades t LEFT JOIN trade_payloads p ON p.trade_id = t.id "
+                "WHERE t.run_id IS ? ORDER BY t.id", (run_id,)))
+            signals = _dump_rows(f, "signals", conn.execute(
+                "SELECT * FROM signals WHERE run_id IS ? ORDER BY id", (run_id,)))
+        conn.execute("DELETE FROM trade_payloads WHERE trade_id IN (SELECT id FROM trades WHERE run_id IS ?)", (run_id,))
+        conn.execute("DELETE FROM trades WHERE run_id IS ?", (run_id,))
+        conn.execute("DELETE FROM signals WHERE run_id IS ?", (run_id,))
+        conn.execute("DELETE FROM runs WHERE id IS ?", (run_id,))
+        conn.commit()
+        stats["runs"] += 1
+        stats["trades"] += trades
+        stats["signals"] += signals
+    conn.close()
+    return stats
+
+def compact_db(pages: int = 0):
+    # возвращает освободившиеся страницы ОС и обрезает WAL
+    conn = _conn()
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})" if pages else "PRAGMA incremental_vacuum").fetchall()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    conn.close()
+
+def run_retention(older_than_days: int, archive_dir: Optional[str] = None, active_runs=()) -> Dict[str, int]:
+    stats = archive_runs(older_than_days, archive_dir, active_runs)
+    compact_db()
+    return stats
@@ -1,13 +1,19 @@
 ﻿# exchange.py
-import ccxt
+from __future__ import annotations
 import os
 import asyncio
 import logging
-from typing import Any, Optional
+from typing import Any, Optional, TYPE_CHECKING
+
+from profiler import profiled
+
+if TYPE_CHECKING:
+    import ccxt
 
 log = logging.getLogger("bybit_bot.exchange")
 
 def create_exchange(api_key: str = "", api_secret: str = "", testnet: bool = True, default_type: str = "swap"):
+    import ccxt
     params = {
         "apiKey": api_key or "",
         "secret": api_secret or "",
@@ -23,6 +29,7 @@ def create_exchange(api_key: str = "", api_secret: str = "", testnet: bool = Tru
             log.warning("Cannot set sandbox mode on this ccxt/bybit version.")
     return exchange
 
+@profiled("exchange")
 async def fetch_ohlcv(exchange: ccxt.Exchange, symbol: str, timeframe: str, limit: int = 500):
     try:
         data = await asyncio.to_thread(exchange.fetch_ohlcv, symbol, timeframe=timeframe, limit=limit)
@@ -38,6 +45,7 @@ async def fetch_ohlcv(exchange: ccxt.Exchange, symbol: str, timeframe: str, limi
         import pandas as pd
         return pd.DataFrame()
 
+@profiled("exchange")
 async def fetch_ticker(exchange: ccxt.Exchange, symbol: str) -> dict:
     try:
         return await asyncio.to_thread(exchange.fetch_ticker, symbol)
@@ -45,6 +53,48 @@ async def fetch_ticker(exchange: ccxt.Exchange, symbol: str) -> dict:
         log.exception("fetch_ticker error %s: %s", symbol, e)
         return {}
 
+class TickerCache:
+    # последние цены для стопов между опросами свечей; один fetch_tickers на все символы за ttl
+    def __init__(self, exchange: ccxt.Exchange, ttl: float = 2.0):
+        self.exchange = exchange
+        self.ttl = ttl
+        self.prices: dict = {}
+        self.updated = 0.0
+        self.symbols: set = set()
+        self._lock = asyncio.Lock()
+
+    @profiled("exchange")
+    async def _refresh(self):
+        symbols = sorted(self.symbols)
+        try:
+            if self.exchange.has.get("fetchTickers"):
+                ticks = await asyncio.to_thread(self.exchange.fetch_tickers, symbols)
+            else:
+                ticks = {s: await asyncio.to_thread(self.exchange.fetch_ticker, s) for s in symbols}
+        except Exception as e:
+            log.warning("fetch_tickers error: %s", e)
+            return
+        for s, t in (ticks or {}).items():
+            px = float(t.get("last") or t.get("close") or 0.0)
+            if px > 0:
+                self.prices[s] = px
+        self.updated = asyncio.get_running_loop().time()
+
+    async def last(self, symbol: str) -> float:
+        self.symbols.add(symbol)
+        loop = asyncio.get_running_loop()
+        if symbol not in self.prices or loop.time() - self.updated > self.ttl:
+            async with self._lock:
+                # пока ждали лок, другой монитор мог уже обновить
+                if symbol not in self.prices or loop.time() - self.updated > self.ttl:
+                    await self._refresh()
+        return self.prices.get(symbol, 0.0)
+
+    def forget(self, symbol: str):
+        # монитор пары остановлен — символ больше не запрашиваем (другой монитор того же символа добавит его снова)
+        self.symbols.discard(symbol)
+        self.prices.pop(symbol, None)
+
 async def market_price(exchange: ccxt.Exchange, symbol: str) -> float:
     tick = await fetch_ticker(exchange, symbol)
     return float(tick.get("last") or tick.get("close") or 0.0)
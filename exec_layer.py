@@ -3,6 +3,7 @@ import asyncio
 import logging
 from typing import Tuple, Optional
 from db import log_trade
+from profiler import stage
 
 log = logging.getLogger("bybit_bot.exec")
 
@@ -13,9 +14,16 @@ class ExecLayer:
         self.run_id = run_id
         self.hedge_mode = hedge_mode
 
-    async def open(self, symbol: str, side: str, usdt_value: float) -> Tuple[bool,str,float,float]:
-        px = await asyncio.to_thread(self.exchange.fetch_ticker, symbol)
-        price = float(px.get("last") or px.get("close") or 0.0)
+    async def _price(self, symbol: str, price: Optional[float]) -> float:
+        # теневые варианты передают цену свечи — без лишнего запроса тикера
+        if price is not None and self.mode != "live":
+            return float(price)
+        with stage("exchange"):
+            px = await asyncio.to_thread(self.exchange.fetch_ticker, symbol)
+        return float(px.get("last") or px.get("close") or 0.0)
+
+    async def open(self, symbol: str, side: str, usdt_value: float, price: Optional[float] = None) -> Tuple[bool,str,float,float]:
+        price = await self._price(symbol, price)
         if price <= 0:
             return False, "bad price", 0.0, 0.0
         qty = usdt_value / price
@@ -32,25 +40,28 @@ class ExecLayer:
             return False, "amount too small", 0.0, price
 
         info = "paper"
+        order = None
         if self.mode == "live":
             side_api = "buy" if side=="long" else "sell"
             params = {"reduceOnly": False}
-            order = await asyncio.to_thread(self.exchange.create_market_order, symbol, side_api, qty, None, params)
-            info = str(order)
+            with stage("exchange"):
+                order = await asyncio.to_thread(self.exchange.create_market_order, symbol, side_api, qty, None, params)
+            info = "live"
 
-        log_trade(self.run_id, symbol, side, "open", qty, price, qty*price, None, info)
+        log_trade(self.run_id, symbol, side, "open", qty, price, qty*price, None, info, order=order)
         return True, "ok", qty, price
 
-    async def close(self, symbol: str, side: str, qty: float) -> Tuple[bool,str,float,float]:
-        px = await asyncio.to_thread(self.exchange.fetch_ticker, symbol)
-        price = float(px.get("last") or px.get("close") or 0.0)
+    async def close(self, symbol: str, side: str, qty: float, price: Optional[float] = None) -> Tuple[bool,str,float,float]:
+        price = await self._price(symbol, price)
         info = "paper"
+        order = None
         if self.mode == "live":
             side_api = "sell" if side=="long" else "buy"
             params = {"reduceOnly": True}
-            order = await asyncio.to_thread(self.exchange.create_market_order, symbol, side_api, qty, None, params)
-            info = str(order)
-        log_trade(self.run_id, symbol, side, "close", qty, price, qty*price, None, info)
+            with stage("exchange"):
+                order = await asyncio.to_thread(self.exchange.create_market_order, symbol, side_api, qty, None, params)
+            info = "live"
+        log_trade(self.run_id, symbol, side, "close", qty, price, qty*price, None, info, order=order)
         return True, "ok", qty, price
 
     def partial_close(self, symbol: str, side: str, qty: float, px: float):
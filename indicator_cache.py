@@ -0,0 +1,93 @@
+﻿# indicator_cache.py
+import os
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+OHLCV_COLUMNS = ("open", "high", "low", "close", "volume")
+
+# (кол-во баров, ts последнего бара, хэш OHLCV) — индикаторы зависят от всей истории, поэтому хэшируем весь ряд
+def series_fingerprint(df) -> Tuple[int, int, str]:
+    import numpy as np
+    if df is None or len(df) == 0:
+        return (0, 0, "")
+    cols = [c for c in OHLCV_COLUMNS if c in df.columns]
+    data = np.ascontiguousarray(df[cols].to_numpy(dtype="float64"))
+    digest = hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest()
+    last = df.index[-1]
+    try:
+        last_ts = int(getattr(last, "value", last))
+    except (TypeError, ValueError):
+        last_ts = 0
+    return (len(df), last_ts, digest)
+
+# LRU-кэш колонок индикаторов, ограниченный по памяти.
+# key: (symbol, timeframe, fingerprint, indicator, window) -> numpy array
+class IndicatorCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        size = int(getattr(value, "nbytes", 0))
+        if size > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.bytes -= int(getattr(old, "nbytes", 0))
+        self._data[key] = value
+        self.bytes += size
+        self._evict()
+
+    def resize(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._data:
+            _, evicted = self._data.popitem(last=False)
+            self.bytes -= int(getattr(evicted, "nbytes", 0))
+            self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+def env_max_bytes() -> int:
+    return int(float(os.getenv("INDICATOR_CACHE_MB", "64")) * 1024 * 1024)
+
+# общий кэш процесса: разные пары/конфиги на одном символе переиспользуют колонки;
+# bot.init_app() пересчитывает лимит после load_dotenv()
+INDICATOR_CACHE = IndicatorCache(env_max_bytes())
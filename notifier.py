@@ -0,0 +1,125 @@
+﻿# notifier.py
+import asyncio
+import logging
+from collections import deque
+from typing import Any, List, Optional, Tuple, Union
+
+log = logging.getLogger("bybit_bot.notifier")
+
+TG_MAX_LEN = 4096
+
+def _seconds(value: Any) -> float:
+    # RetryAfter.retry_after: int в старых PTB, timedelta в новых
+    if hasattr(value, "total_seconds"):
+        return float(value.total_seconds())
+    return float(value)
+
+def split_digest(lines: List[str], max_len: int = TG_MAX_LEN) -> List[str]:
+    chunks, cur = [], ""
+    for line in lines:
+        while len(line) > max_len:
+            if cur:
+                chunks.append(cur); cur = ""
+            chunks.append(line[:max_len]); line = line[max_len:]
+        if cur and len(cur) + 1 + len(line) > max_len:
+            chunks.append(cur); cur = ""
+        cur = f"{cur}\n{line}" if cur else line
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+class TelegramNotifier:
+    # очередь исходящих: send() не блокирует торговые задачи, фоновая задача склеивает пачки и держит лимиты чата
+    def __init__(self, bot, chat_id: Union[int, str], min_interval: float = 1.0, coalesce_window: float = 1.0,
+                 max_pending: int = 1000, max_retries: int = 5):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self._pending: "deque[Tuple[str, Any]]" = deque(maxlen=max_pending)
+        self._event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._last_sent = 0.0
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, text: str, reply_markup=None):
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append((text, reply_markup))
+        self._event.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        # фоновая задача сама дописывает очередь (включая пачку, уже снятую _next_batch); отменяем только по таймауту
+        self._closing = True
+        self._event.set()
+        task, self._task = self._task, None
+        if task is None:
+            task = asyncio.create_task(self._drain())
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        if not done:
+            task.cancel()
+            log.warning("TG: не отправлено %s сообщений при остановке", len(self._pending))
+
+    async def _run(self):
+        while True:
+            await self._event.wait()
+            if not self._closing:
+                await asyncio.sleep(self.coalesce_window)  # собираем всплеск в один дайджест
+            self._event.clear()
+            await self._drain()
+            if self._closing:
+                return
+
+    def _next_batch(self) -> Tuple[List[str], Any]:
+        # подряд идущие текстовые сообщения склеиваются; сообщение с клавиатурой уходит отдельно
+        batch: List[str] = []
+        while self._pending:
+            text, markup = self._pending[0]
+            if markup is not None:
+                if batch:
+                    break
+                self._pending.popleft()
+                return [text], markup
+            batch.append(self._pending.popleft()[0])
+        return batch, None
+
+    async def _drain(self):
+        while self._pending:
+            batch, markup = self._next_batch()
+            for chunk in split_digest(batch):
+                await self._deliver(chunk, markup)
+
+    async def _deliver(self, text: str, reply_markup=None):
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            wait = self._last_sent + self.min_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await self.bot.send_message(chat_id=self.chat_id, text=text, reply_markup=reply_markup)
+                self._last_sent = loop.time()
+                self.sent += 1
+                return
+            except Exception as e:
+                self._last_sent = loop.time()
+                retry_after = getattr(e, "retry_after", None)
+                if attempt == self.max_retries:
+                    log.exception("TG send error: %s", e)
+                    break
+                if retry_after is not None:
+                    pause = _seconds(retry_after)
+                else:
+                    pause = delay
+                    delay = min(delay * 2, 60.0)
+                log.warning("TG send error (%s), повтор через %.1fs", e, pause)
+                await asyncio.sleep(pause)
+        self.dropped += 1
@@ -0,0 +1,96 @@
+﻿# pair_registry.py
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from pairs_loader import get_pairs_path, load_pairs, save_pairs
+
+log = logging.getLogger("bybit_bot.pairs")
+
+def pair_key(symbol: str, timeframe: str) -> str:
+    return f"{symbol}|{timeframe}"
+
+class PairRegistry:
+    # пары в памяти; единственный источник истины на диске — pairs.json (PAIRS_FILE)
+    def __init__(self):
+        self._pairs: Optional[List[Tuple[str, str]]] = None
+        self.broken = False  # pairs.json не разбирается — держим прежний список и файл не трогаем
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        if self._pairs is None:
+            self.reload()
+        return list(self._pairs)
+
+    def keys(self) -> List[str]:
+        return [pair_key(s, t) for s, t in self.pairs()]
+
+    def reload(self) -> List[Tuple[str, str]]:
+        if not self._file_usable():
+            # иначе пустой список погасит все мониторы, а следующий add перезапишет файл пользователя
+            self.broken = True
+            log.warning("Не удалось разобрать %s — оставлен прежний список пар, файл не перезаписывается", get_pairs_path())
+            if self._pairs is None:
+                self._pairs = []
+            return list(self._pairs)
+        self.broken = False
+        pairs = []
+        for s, t in load_pairs():
+            if (s, t) not in pairs:
+                pairs.append((s, t))
+        if not pairs:
+            pairs = self._legacy_db_pairs()
+        self._pairs = pairs
+        return list(pairs)
+
+    @staticmethod
+    def _file_usable() -> bool:
+        # load_pairs() отдаёт [] и на битый файл — отличаем его от пустого/отсутствующего
+        path = get_pairs_path()
+        if not os.path.exists(path):
+            return True
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for p in json.load(f):
+                    p["symbol"]
+            return True
+        except Exception:
+            return False
+
+    def _legacy_db_pairs(self) -> List[Tuple[str, str]]:
+        # раньше пары дублировались в таблицу pairs — переносим их в файл один раз и очищаем таблицу
+        try:
+            from db import clear_pairs, list_pairs
+            pairs = [(s, t) for s, t in list_pairs()]
+        except Exception:
+            return []
+        if pairs:
+            save_pairs(pairs)
+            if load_pairs() != pairs:
+                log.warning("Не удалось записать pairs.json — пары из БД оставлены в таблице")
+                return pairs
+            clear_pairs()
+            log.info("Пары перенесены из БД в pairs.json: %s", pairs)
+        return pairs
+
+    def add(self, symbol: str, timeframe: str) -> bool:
+        pairs = self.pairs()
+        if (symbol, timeframe) in pairs:
+            return False
+        pairs.append((symbol, timeframe))
+        self._set(pairs)
+        return True
+
+    def remove(self, symbol: str) -> List[Tuple[str, str]]:
+        pairs = self.pairs()
+        removed = [(s, t) for s, t in pairs if s == symbol]
+        if removed:
+            self._set([(s, t) for s, t in pairs if s != symbol])
+        return removed
+
+    def _set(self, pairs: List[Tuple[str, str]]):
+        self._pairs = pairs
+        if self.broken:
+            log.warning("%s не разобран — изменение пар только в памяти до исправления файла", get_pairs_path())
+            return
+        save_pairs(pairs)
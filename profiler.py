@@ -0,0 +1,194 @@
+﻿# profiler.py
+import os
+import sys
+import time
+import threading
+import functools
+import inspect
+import logging
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional
+
+log = logging.getLogger("bybit_bot.profiler")
+
+PROFILE_MODES = ("sample", "cprofile")
+
+_NULL = nullcontext()
+
+class Sampler(threading.Thread):
+    # семплирующий профайлер: стеки всех потоков раз в interval, формат collapsed для flamegraph.pl/speedscope
+    def __init__(self, interval: float = 0.005):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: Dict[str, int] = defaultdict(int)
+        self.self_counts: Dict[str, int] = defaultdict(int)
+        self.total_counts: Dict[str, int] = defaultdict(int)
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(self._label(frame))
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                stack.reverse()
+                self.stacks[";".join([names.get(tid, str(tid))] + stack)] += 1
+                self.self_counts[stack[-1]] += 1
+                for fn in set(stack):
+                    self.total_counts[fn] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1.0)
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.mode = "sample"
+        self.stages: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+        self.started = 0.0
+        self._sampler: Optional[Sampler] = None
+        self._cprofile = None
+
+    def start(self, mode: str = "sample", interval: float = 0.005):
+        if self.enabled:
+            return
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"unknown profile mode: {mode}")
+        self.mode = mode
+        self.stages.clear()
+        self._sampler = Sampler(interval)
+        self._sampler.start()
+        if mode == "cprofile":
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self.started = time.perf_counter()
+        self.enabled = True
+
+    def add(self, name: str, elapsed: float):
+        st = self.stages[name]
+        st[0] += 1
+        st[1] += elapsed
+
+    def stage_report(self, wall: float, stages: Optional[Dict[str, List[float]]] = None) -> str:
+        # стадии инклюзивные: position включает вложенные exchange/db
+        stages = self.stages if stages is None else stages
+        lines = [f"{'stage':<14}{'calls':>10}{'total ms':>12}{'avg ms':>10}{'% wall':>8}"]
+        for name, (calls, total) in sorted(stages.items(), key=lambda kv: kv[1][1], reverse=True):
+            pct = total / wall * 100 if wall > 0 else 0.0
+            lines.append(f"{name:<14}{calls:>10}{total * 1000:>12.1f}{total * 1000 / calls:>10.3f}{pct:>8.1f}")
+        lines.append(f"wall: {wall:.2f}s")
+        return "\n".join(lines)
+
+    def halt(self) -> Optional[Dict[str, object]]:
+        # вызывать из того потока, где был start(): cProfile.disable() снимает профайлер только с текущего потока
+        if not self.enabled:
+            return None
+        self.enabled = False
+        wall = time.perf_counter() - self.started
+        prof, self._cprofile = self._cprofile, None
+        if prof is not None:
+            prof.disable()
+        sampler, self._sampler = self._sampler, None
+        sampler.stop()
+        return {"wall": wall, "stages": dict(self.stages), "sampler": sampler, "cprofile": prof}
+
+    def write(self, snap: Dict[str, object], out_dir: Optional[str] = None, tag: str = "run") -> Dict[str, str]:
+        # пишет отчёты по результату halt(); можно гонять в отдельном потоке
+        sampler, prof = snap["sampler"], snap["cprofile"]
+        if not out_dir:
+            base = os.getenv("PROFILE_DIR", "profiles")
+            out_dir = os.path.join(base, f"{tag}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}")
+        os.makedirs(out_dir, exist_ok=True)
+        paths = {
+            "stages": os.path.join(out_dir, "stages.txt"),
+            "functions": os.path.join(out_dir, "functions.txt"),
+            "collapsed": os.path.join(out_dir, "stacks.collapsed"),
+        }
+        with open(paths["stages"], "w", encoding="utf-8") as f:
+            f.write(self.stage_report(snap["wall"], snap["stages"]) + "\n")
+        with open(paths["collapsed"], "w", encoding="utf-8") as f:
+            for stack, count in sorted(sampler.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(paths["functions"], "w", encoding="utf-8") as f:
+            n = max(sampler.samples, 1)
+            f.write(f"samples: {sampler.samples} (interval {sampler.interval * 1000:.1f} ms)\n")
+            f.write(f"{'self %':>8}{'total %':>9}  function\n")
+            for fn, cnt in sorted(sampler.self_counts.items(), key=lambda kv: kv[1], reverse=True)[:200]:
+                f.write(f"{cnt / n * 100:>8.1f}{sampler.total_counts[fn] / n * 100:>9.1f}  {fn}\n")
+        if prof is not None:
+            import pstats
+            paths["pstats"] = os.path.join(out_dir, "profile.pstats")
+            prof.dump_stats(paths["pstats"])
+            with open(paths["functions"], "a", encoding="utf-8") as f:
+                f.write("\n# cProfile (cumulative)\n")
+                pstats.Stats(prof, stream=f).sort_stats("cumulative").print_stats(60)
+        log.info("Профиль сохранён: %s", out_dir)
+        return paths
+
+    def stop(self, out_dir: Optional[str] = None, tag: str = "run") -> Dict[str, str]:
+        # halt() + write(); возвращает {report: path}
+        snap = self.halt()
+        return self.write(snap, out_dir, tag) if snap else {}
+
+PROFILER = Profiler()
+
+def stage(name: str):
+    # with stage("db"): ... — почти бесплатно, когда профилирование выключено
+    if not PROFILER.enabled:
+        return _NULL
+    return _timed(name)
+
+@contextmanager
+def _timed(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        PROFILER.add(name, time.perf_counter() - t0)
+
+def profiled(name: str):
+    # декоратор стадии для обычных и async функций
+    def deco(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                if not PROFILER.enabled:
+                    return await fn(*args, **kwargs)
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    PROFILER.add(name, time.perf_counter() - t0)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                PROFILER.add(name, time.perf_counter() - t0)
+        return wrapper
+    return deco
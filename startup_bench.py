@@ -0,0 +1,63 @@
+﻿# startup_bench.py
+# Бенчмарк времени импорта на основе `python -X importtime`.
+# python startup_bench.py [--budget-ms 150] [--repeat 5] [--top 10] [modules...]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+DEFAULT_MODULES = ["bot", "backtest"]
+# не должны грузиться при импорте — только там, где реально нужны
+HEAVY = ("pandas", "numpy", "ccxt", "telegram", "ta", "cryptography", "yaml")
+
+def importtime(module: str) -> Tuple[int, List[Tuple[int, int, str]]]:
+    # (cumulative us для module, [(self us, cumulative us, name)] для всех импортов)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=base_dir, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        rows.append((int(self_us), int(cum_us), name))
+        if depth == 0 and name == module:
+            total = int(cum_us)
+    return total, rows
+
+def run(modules: List[str], repeat: int, top: int, budget_ms: float) -> bool:
+    ok = True
+    for module in modules:
+        totals = []
+        rows: List[Tuple[int, int, str]] = []
+        for _ in range(repeat):
+            total, rows = importtime(module)
+            totals.append(total)
+        best = min(totals) / 1000.0
+        med = statistics.median(totals) / 1000.0
+        loaded = sorted({name.split(".")[0] for _, _, name in rows} & set(HEAVY))
+        print(f"{module}: best {best:.1f} ms, median {med:.1f} ms (budget {budget_ms:.0f} ms)")
+        print(f"  heavy modules loaded: {', '.join(loaded) or '—'}")
+        for self_us, cum_us, name in sorted(rows, key=lambda r: r[0], reverse=True)[:top]:
+            print(f"  {self_us / 1000.0:8.2f} ms self {cum_us / 1000.0:8.2f} ms cum  {name}")
+        if best > budget_ms or loaded:
+            ok = False
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "150")))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.modules, args.repeat, args.top, args.budget_ms) else 1)
@@ -1,13 +1,13 @@
 ﻿# strategy.py
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional, Tuple, Dict, Any
-import pandas as pd
-import numpy as np
+from typing import Optional, Tuple, Dict, Any, List, TYPE_CHECKING
 
-from ta.trend import EMAIndicator, ADXIndicator
-from ta.momentum import RSIIndicator
-from ta.volatility import AverageTrueRange
+from indicator_cache import INDICATOR_CACHE, IndicatorCache, series_fingerprint
+from profiler import profiled
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 @dataclass
 class Signal:
@@ -18,9 +18,38 @@ class Signal:
     stop_dist: float
     info: Dict[str, Any]
 
+# indicator name -> fn(df, window); одинаковые (name, window) считаются один раз через кэш
+def _ema(df: pd.DataFrame, window: int) -> pd.Series:
+    from ta.trend import EMAIndicator
+    return EMAIndicator(df["close"], window=window, fillna=True).ema_indicator()
+
+def _rsi(df: pd.DataFrame, window: int) -> pd.Series:
+    from ta.momentum import RSIIndicator
+    return RSIIndicator(df["close"], window=window, fillna=True).rsi()
+
+def _adx(df: pd.DataFrame, window: int) -> pd.Series:
+    from ta.trend import ADXIndicator
+    return ADXIndicator(df["high"], df["low"], df["close"], window=window, fillna=True).adx()
+
+def _atr(df: pd.DataFrame, window: int) -> pd.Series:
+    from ta.volatility import AverageTrueRange
+    return AverageTrueRange(df["high"], df["low"], df["close"], window=window, fillna=True).average_true_range()
+
+def _vol_sma(df: pd.DataFrame, window: int) -> pd.Series:
+    return df["volume"].rolling(window).mean().fillna(0)
+
+INDICATORS = {
+    "ema": _ema,
+    "rsi": _rsi,
+    "adx": _adx,
+    "atr": _atr,
+    "vol_sma": _vol_sma,
+}
+
 class Strategy:
-    def __init__(self, params: Dict[str,Any], param_getter=None):
+    def __init__(self, params: Dict[str,Any], param_getter=None, cache: Optional[IndicatorCache] = INDICATOR_CACHE):
         self.params = params.copy()
+        self.cache = cache
         self.get = param_getter or (lambda k, default=None: self.params.get(k, default))
 
         # internal map with defaults
@@ -44,19 +73,57 @@ class Strategy:
             "tp_rr": float(g("tp_rr", 1.0)),
         }
 
-    def compute_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
+    def indicator_specs(self) -> List[Tuple[str, str, int]]:
+        # (column, indicator, window)
+        return [
+            ("ema_fast", "ema", self.map["ema_fast"]),
+            ("ema_slow", "ema", self.map["ema_slow"]),
+            ("ema_trend", "ema", self.map["ema_trend"]),
+            ("rsi", "rsi", self.map["rsi_len"]),
+            ("adx", "adx", self.map["adx_len"]),
+            ("atr", "atr", self.map["atr_len"]),
+            ("vol_sma", "vol_sma", self.map["vol_len"]),
+        ]
+
+    @profiled("indicators")
+    def compute_indicators(self, df: pd.DataFrame, symbol: str = "", timeframe: str = "") -> pd.DataFrame:
         df = df.copy()
-        df["ema_fast"] = EMAIndicator(df["close"], window=self.map["ema_fast"], fillna=True).ema_indicator()
-        df["ema_slow"] = EMAIndicator(df["close"], window=self.map["ema_slow"], fillna=True).ema_indicator()
-        df["ema_trend"] = EMAIndicator(df["close"], window=self.map["ema_trend"], fillna=True).ema_indicator()
-        df["rsi"] = RSIIndicator(df["close"], window=self.map["rsi_len"], fillna=True).rsi()
-        adx_obj = ADXIndicator(df["high"], df["low"], df["close"], window=self.map["adx_len"], fillna=True)
-        df["adx"] = adx_obj.adx()
-        atr_obj = AverageTrueRange(df["high"], df["low"], df["close"], window=self.map["atr_len"], fillna=True)
-        df["atr"] = atr_obj.average_true_range()
-        df["vol_sma"] = df["volume"].rolling(self.map["vol_len"]).mean().fillna(0)
+        if self.cache is None:
+            for col, name, window in self.indicator_specs():
+                df[col] = INDICATORS[name](df, window)
+            return df
+        # кэш по колонкам: переиспользуем каждую колонку отдельно, считаем только недостающие
+        fp = series_fingerprint(df)
+        for col, name, window in self.indicator_specs():
+            key = (symbol, timeframe, fp, name, window)
+            df[col] = self.cache.get_or_compute(key, lambda: INDICATORS[name](df, window).to_numpy())
         return df
 
+    @profiled("signal")
+    def signal_arrays(self, df: pd.DataFrame) -> Dict[str, Any]:
+        # векторный аналог generate_signal для всех баров сразу: side 1/-1/0, stop, tp, stop_dist
+        import numpy as np
+        m = self.map
+        price = df["close"].to_numpy(dtype="float64")
+        ema_fast = df["ema_fast"].to_numpy(dtype="float64")
+        ema_slow = df["ema_slow"].to_numpy(dtype="float64")
+        ema_trend = df["ema_trend"].to_numpy(dtype="float64")
+        rsi = df["rsi"].to_numpy(dtype="float64")
+        adx = df["adx"].to_numpy(dtype="float64")
+        atr = df["atr"].to_numpy(dtype="float64")
+        vol = df["volume"].to_numpy(dtype="float64")
+        vol_sma = df["vol_sma"].to_numpy(dtype="float64")
+
+        ok = (adx >= m["adx_threshold"]) & ~((vol_sma > 0) & (vol < vol_sma * m["vol_mult"]))
+        long = ok & (price > ema_trend) & (ema_fast > ema_slow) & (rsi > m["rsi_entry_long"])
+        short = ok & (price < ema_trend) & (ema_fast < ema_slow) & (rsi < m["rsi_entry_short"]) & ~long
+        stop = np.where(long, price - atr * m["atr_mult_stop"], price + atr * m["atr_mult_stop"])
+        stop_dist = np.where(long, price - stop, stop - price)
+        tp = np.where(long, price + stop_dist * m["tp_rr"], price - stop_dist * m["tp_rr"])
+        valid = (stop > 0) & (stop_dist > 0)
+        side = np.where(long & valid, 1, np.where(short & valid, -1, 0)).astype("int8")
+        return {"side": side, "stop": stop, "tp": tp, "stop_dist": stop_dist}
+
     def size_from_risk(self, equity_usdt: float, price: float, stop_dist: float, risk_pct: float, min_usdt: float) -> float:
         if price <= 0 or stop_dist <= 0:
             return min_usdt
@@ -67,6 +134,7 @@ class Strategy:
         position_usdt = usdt_at_risk / stop_pct
         return max(position_usdt, min_usdt)
 
+    @profiled("signal")
     def generate_signal(self, df: pd.DataFrame, equity_usdt: float = 10000.0) -> Signal:
         row = df.iloc[-1]
         price = float(row["close"])
@@ -0,0 +1,45 @@
+﻿# variants.py
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import create_run
+from exec_layer import ExecLayer
+from strategy import Strategy
+
+@dataclass
+class Variant:
+    name: str
+    strat: Strategy
+    execL: ExecLayer
+    live: bool
+    pos: Optional[Dict[str, Any]] = None
+    last_signal_ts: Any = None
+
+def variant_params(cfg: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], Dict[str, Any], bool]]:
+    # (name, params, overrides, live): основной конфиг + теневые варианты поверх него
+    base = dict(cfg.get("strategy") or {})
+    out = [("main", base, {}, True)]
+    for i, v in enumerate(cfg.get("shadow_variants") or []):
+        name = str(v.get("name") or f"shadow{i + 1}")
+        overrides = dict(v.get("strategy") or {})
+        params = dict(base)
+        params.update(overrides)
+        out.append((name, params, overrides, False))
+    return out
+
+def build_variants(cfg: Dict[str, Any], exchange, mode: str, symbol: str) -> List[Variant]:
+    variants = []
+    for name, params, overrides, live in variant_params(cfg):
+        if live:
+            getter = lambda k, d=None: os.getenv(k, d)
+            run_mode = mode
+            desc = f"run {mode} {symbol}"
+        else:
+            # явные параметры теневого варианта не перекрываются переменными окружения
+            getter = lambda k, d=None, o=overrides: o[k.lower()] if k.lower() in o else os.getenv(k, d)
+            run_mode = "paper"
+            desc = f"run shadow:{name} {symbol}"
+        strat = Strategy(params, param_getter=getter)
+        variants.append(Variant(name, strat, ExecLayer(exchange, run_mode, create_run(desc)), live))
+    return variants
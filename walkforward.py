@@ -0,0 +1,173 @@
+﻿# walkforward.py
+from __future__ import annotations
+import itertools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from backtest import INITIAL_BALANCE, cached_backtest, curve_metrics, series_origin, warmup_bars
+from backtest_cache import BacktestCache
+from strategy import Strategy
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = logging.getLogger("bybit_bot.walkforward")
+
+# состояние воркера: кадры с индикаторами на всю историю (по одному на комбинацию), передаются один раз
+_W: Dict[str, Any] = {}
+
+def param_grid(base: Dict[str, Any], grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = sorted(grid)
+    combos = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(base)
+        params.update(zip(keys, values))
+        combos.append(params)
+    return combos or [dict(base)]
+
+def split_windows(n: int, is_bars: int, oos_bars: int, step: Optional[int] = None) -> List[Tuple[int, int, int]]:
+    # (is_start, oos_start, oos_end): скользящие окна, OOS идут встык
+    step = step or oos_bars
+    out = []
+    start = 0
+    while start + is_bars + oos_bars <= n:
+        out.append((start, start + is_bars, start + is_bars + oos_bars))
+        start += step
+    return out
+
+def make_strategy(params: Dict[str, Any], risk: Dict[str, Any]) -> Strategy:
+    return Strategy(params, param_getter=lambda k, d=None: risk.get(k.lower(), d))
+
+def _init_worker(frames: List[pd.DataFrame], combos: List[Dict[str, Any]], risk: Dict[str, Any],
+                 metric: str, cache_dir: Optional[str], fill_model: str = "close", priority: str = "stop",
+                 origin: Tuple = ()):
+    _W["frames"] = frames
+    _W["origin"] = origin
+    _W["strats"] = [make_strategy(p, risk) for p in combos]
+    _W["combos"] = combos
+    _W["metric"] = metric
+    _W["cache"] = BacktestCache(cache_dir) if cache_dir else None
+    _W["fill"] = {"fill_model": fill_model, "priority": priority}
+
+def _slice_run(ci: int, a: int, b: int):
+    strat = _W["strats"][ci]
+    # индикаторы уже посчитаны по всей истории — прогрев нужен только в самом начале ряда
+    warm = max(0, warmup_bars(strat) - a)
+    # индикаторы среза зависят от всей истории — в ключ кэша идёт отпечаток полного ряда и границы
+    res, _ = cached_backtest(_W["frames"][ci].iloc[a:b], strat, _W["cache"], warm=warm,
+                             origin=_W["origin"] + (a, b), **_W["fill"])
+    return res
+
+def _run_window(win: Tuple[int, int, int, int]) -> Dict[str, Any]:
+    idx, a, b, c = win
+    cache = _W["cache"]
+    hits0, misses0 = (cache.hits, cache.misses) if cache else (0, 0)
+    metric = _W["metric"]
+    best_ci, best_score = 0, None
+    for ci in range(len(_W["strats"])):
+        score = _slice_run(ci, a, b).metrics.get(metric, 0.0)
+        if best_score is None or score > best_score:
+            best_ci, best_score = ci, score
+    oos = _slice_run(best_ci, b, c)
+    return {
+        "window": idx,
+        "is": (a, b),
+        "oos": (b, c),
+        "params": _W["combos"][best_ci],
+        "is_score": best_score,
+        "oos_ts": oos.ts,
+        "oos_equity": oos.equity,
+        "oos_metrics": oos.metrics,
+        "oos_trades": len(oos.trades),
+        "cache_hits": (cache.hits - hits0) if cache else 0,
+        "cache_misses": (cache.misses - misses0) if cache else 0,
+    }
+
+def stitch(results: List[Dict[str, Any]], initial: float = INITIAL_BALANCE):
+    # каждое OOS-окно стартует с initial — сшиваем по доходностям
+    import numpy as np
+    ts_parts, eq_parts = [], []
+    scale = 1.0
+    for r in results:
+        eq = np.asarray(r["oos_equity"], dtype="float64")
+        if not len(eq) or eq[0] <= 0:
+            continue
+        eq_parts.append(eq * scale)
+        ts_parts.append(np.asarray(r["oos_ts"], dtype="int64"))
+        scale *= eq[-1] / initial
+    if not eq_parts:
+        return np.array([], dtype="int64"), np.array([initial])
+    return np.concatenate(ts_parts), np.concatenate(eq_parts)
+
+def walk_forward(df: pd.DataFrame, base_params: Dict[str, Any], grid: Dict[str, List[Any]], risk: Dict[str, Any],
+                 is_bars: int, oos_bars: int, step: Optional[int] = None, metric: str = "sharpe",
+                 workers: int = 0, cache: Optional[BacktestCache] = None,
+                 symbol: str = "", timeframe: str = "", fill_model: str = "close", priority: str = "stop") -> Dict[str, Any]:
+    combos = param_grid(base_params, grid)
+    windows = split_windows(len(df), is_bars, oos_bars, step)
+    if not windows:
+        raise ValueError(f"not enough bars for walk-forward: {len(df)} < {is_bars + oos_bars}")
+
+    # индикаторы — один раз на всю историю; общие окна (ema 50 и т.п.) переиспользуются через кэш
+    frames = [make_strategy(p, risk).compute_indicators(df, symbol, timeframe) for p in combos]
+    jobs = [(i, a, b, c) for i, (a, b, c) in enumerate(windows)]
+    init_args = (frames, combos, risk, metric, cache.path if cache else None, fill_model, priority, series_origin(df))
+    workers = workers or os.cpu_count() or 1
+    log.info("walk-forward: %s окон x %s комбинаций, воркеров: %s", len(windows), len(combos), workers)
+    if workers <= 1 or len(jobs) == 1:
+        _init_worker(*init_args)
+        results = [_run_window(j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker, initargs=init_args) as pool:
+            results = list(pool.map(_run_window, jobs))
+
+    results.sort(key=lambda r: r["window"])
+    ts, equity = stitch(results)
+    if cache is not None:
+        cache.hits += sum(r["cache_hits"] for r in results)
+        cache.misses += sum(r["cache_misses"] for r in results)
+    oos_df = df.iloc[windows[0][1]:windows[-1][2]]
+    return {
+        "windows": results,
+        "combos": len(combos),
+        "ts": ts,
+        "equity": equity,
+        "metrics": curve_metrics(equity, oos_df) if len(equity) > 1 else {},
+    }
+
+async def run_walk_forward(symbol: str, timeframe: str, candles: int, cfg: dict, cache: Optional[BacktestCache] = None,
+                           workers: int = 0, is_bars: Optional[int] = None, oos_bars: Optional[int] = None,
+                           fill_model: str = "close", priority: str = "stop"):
+    from exchange import create_exchange, fetch_ohlcv
+    wf = cfg.get("walk_forward", {}) or {}
+    exchange = create_exchange(testnet=False, default_type=cfg.get("default_market_type","swap"))
+    df = await fetch_ohlcv(exchange, symbol, timeframe, limit=candles)
+    if df.empty:
+        print("No data for", symbol)
+        return
+
+    res = walk_forward(
+        df, cfg.get("strategy", {}) or {}, wf.get("grid", {}) or {}, cfg.get("risk", {}) or {},
+        is_bars=int(is_bars or wf.get("is_bars", 1000)), oos_bars=int(oos_bars or wf.get("oos_bars", 250)),
+        step=wf.get("step"), metric=wf.get("metric", "sharpe"), workers=workers, cache=cache,
+        symbol=symbol, timeframe=timeframe, fill_model=fill_model, priority=priority,
+    )
+    print(f"Walk-forward: {len(res['windows'])} windows x {res['combos']} combos")
+    for r in res["windows"]:
+        m = r["oos_metrics"]
+        changed = {k: v for k, v in r["params"].items() if k in (wf.get("grid") or {})}
+        print(f"  #{r['window']} IS {r['is']} OOS {r['oos']} {changed} -> OOS return {m.get('return_pct', 0.0):.2f}%, trades {r['oos_trades']}")
+    m = res["metrics"]
+    print("OOS stitched result:")
+    print("Final balance:", m.get("final"))
+    print("Return %:", m.get("return_pct"))
+    print("Max drawdown %:", m.get("max_drawdown_pct"))
+    print("Sharpe (annualized):", m.get("sharpe"))
+    if cache is not None:
+        print("Cache:", cache.stats())
+    import pandas as pd
+    pd.DataFrame({"ts": pd.to_datetime(res["ts"]), "equity": res["equity"][:len(res["ts"])]}).to_csv(
+        f"wf_equity_{symbol.replace('/','')}_{timeframe}.csv", index=False)
+    print("OOS equity curve saved.")